@@ -0,0 +1,133 @@
+import io
+import threading
+import pdfplumber
+import pypdfium2 as pdfium
+
+
+# Worker functions live here rather than in the Streamlit script so that
+# process-pool workers can import them by module name.
+
+# PDFium does not allow concurrent calls, even on different documents, and
+# Streamlit runs each session's script on its own thread, so every pypdfium2
+# call goes through this lock
+PDFIUM_LOCK = threading.Lock()
+
+def open_document(file_bytes):
+    """
+    Open a PDF with pypdfium2
+    
+    Args:
+        file_bytes (bytes): Raw PDF bytes
+        
+    Returns:
+        tuple: (pdf, num_pages)
+    """
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(file_bytes)
+        return pdf, len(pdf)
+
+def close_document(pdf):
+    """
+    Close a PDF opened with open_document
+    
+    Args:
+        pdf: Open pypdfium2 PdfDocument
+    """
+    with PDFIUM_LOCK:
+        pdf.close()
+
+class FallbackPdf:
+    """
+    pdfplumber document that is opened on first use and then kept open, so
+    repeated fallbacks on the same file do not re-parse it
+    
+    Args:
+        file_bytes (bytes): Raw PDF bytes
+    """
+    def __init__(self, file_bytes):
+        self.file_bytes = file_bytes
+        self._pdf = None
+    
+    @property
+    def pages(self):
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(io.BytesIO(self.file_bytes))
+        return self._pdf.pages
+    
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
+def extract_pages(pdf, fallback_pdf, start, end):
+    """
+    Extract text from a range of pages of an open document
+    
+    pypdfium2 is used for speed; pages where it finds no text (e.g. table-heavy
+    layouts) are retried with pdfplumber.
+    
+    Args:
+        pdf: PdfDocument from open_document
+        fallback_pdf (FallbackPdf): pdfplumber document for pages without text
+        start (int): Index of the first page to extract
+        end (int): Index one past the last page to extract
+        
+    Returns:
+        list: Text of each page in the range
+    """
+    page_texts = []
+    with PDFIUM_LOCK:
+        for i in range(start, end):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            page_texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+            textpage.close()
+            page.close()
+    
+    for i, text in enumerate(page_texts):
+        if not text.strip():
+            page_texts[i] = fallback_pdf.pages[start + i].extract_text() or ""
+    
+    return page_texts
+
+def extract_page_range(file_bytes, start, end):
+    """
+    Extract text from a range of pages, reopening the PDF in the worker
+    
+    Args:
+        file_bytes (bytes): Raw PDF bytes
+        start (int): Index of the first page to extract
+        end (int): Index one past the last page to extract
+        
+    Returns:
+        list: Text of each page in the range
+    """
+    pdf, _ = open_document(file_bytes)
+    fallback_pdf = FallbackPdf(file_bytes)
+    try:
+        return extract_pages(pdf, fallback_pdf, start, end)
+    finally:
+        fallback_pdf.close()
+        close_document(pdf)
+
+def split_page_range(start, end, num_chunks):
+    """
+    Split a page range into contiguous chunks of near-equal size
+    
+    Args:
+        start (int): Index of the first page
+        end (int): Index one past the last page
+        num_chunks (int): Number of chunks to produce
+        
+    Returns:
+        list: (start, end) tuples covering the range in order
+    """
+    total = end - start
+    chunk_size, remainder = divmod(total, num_chunks)
+    ranges = []
+    for i in range(num_chunks):
+        size = chunk_size + (1 if i < remainder else 0)
+        if size:
+            ranges.append((start, start + size))
+            start += size
+    return ranges
@@ -68,6 +68,42 @@ def user_prompt_classification (pdf_text):
     """
     return user_prompt_for_classification
 
+# user_prompt_for_batch_document_classification
+def user_prompt_batch_classification (pdf_text):
+    user_prompt_for_batch_classification = f"""Perform a classification analysis of each of the following documents:
+
+        DOCUMENTS:
+        {pdf_text}
+
+        Each document is wrapped in <doc id="..."></doc> tags.
+
+        CLASSIFICATION ANALYSIS REQUIREMENTS:
+        1. Parse each document separately and extract details in order to classify it in the following categories
+            - Proof of Identity Document : Documents like passport, class : 0
+            - Proof of Address Document : Documents like  class:1
+            - Business Regostration Document : class:2
+            - Ownership Documents : class:3
+            - Tax Return Document : class:4
+            - Financial Document : class:5
+        2. For each document, provide confidence score which is average probability score of tokens involved
+        3. Return exactly one entry for every document id
+
+
+        Respond in the following structured JSON format:
+        {{
+            "documents": [
+                {{
+                    "id": <document id>,
+                    "category":<one of the category mentioned in the above list>,
+                    "class": class_of_category,
+                    "confidence_score":<average_probability_score>
+                }}
+            ]
+            }}
+
+    """
+    return user_prompt_for_batch_classification
+
 # user_prompt_for_indentity_doc
 def user_prompt_poi(pdf_text,today = today):
 
@@ -520,3 +556,22 @@ def user_prompt_financial(pdf_text,today = today):
         }}
         """
     return user_prompt_for_financial_doc
+
+# Analysis prompts indexed by the class returned by the classification prompt
+user_prompt_mapping = (
+    user_prompt_poi,
+    user_prompt_poa,
+    user_prompt_registration,
+    user_prompt_ownership,
+    user_prompt_tax_return,
+    user_prompt_financial
+)
+
+system_prompt_mapping = (
+    system_prompt_for_indentity_doc,
+    system_prompt_for_poa_doc,
+    system_prompt_for_registration_doc,
+    system_prompt_for_ownership_doc,
+    system_prompt_for_tax_return_doc,
+    system_prompt_for_financial_doc
+)
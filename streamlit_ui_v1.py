@@ -1,11 +1,19 @@
-import io
 import os
 import json
-import boto3
-import pdfplumber
+import xxhash
+import orjson
+import asyncio
+import threading
+import multiprocessing
+import aioboto3
 import streamlit as st
+from aiobotocore.config import AioConfig
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 import prompts  # You'll need to import your prompts module
+import pdf_extraction
 
 # Page config and styling
 st.set_page_config(
@@ -16,7 +24,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better styling
-st.markdown("""
+CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -41,53 +49,148 @@ st.markdown("""
         margin-top: 1rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Streamlit drops elements that are not re-emitted on a rerun, so the style
+# block has to be sent every run for it to stay applied
+st.markdown(CSS, unsafe_allow_html=True)
 
 # Current date
 today = datetime.today().strftime('%Y-%m-%d')
 
+# Stands in for the document inside prompt templates; the text itself is sent
+# once per call as a separate cacheable block (see bedrock_calling)
+DOCUMENT_REFERENCE = "(the document text provided above)"
+
+# Classification only returns a short JSON object, so cap its generation budget.
+# A "}" stop sequence is avoided as the stop text is not returned and would
+# leave the JSON unclosed.
+CLASSIFICATION_MAX_TOKENS = 128
+CLASSIFICATION_STOP_SEQUENCES = ["\n\nHuman:"]
+
+# Upper bound on document text sent in one batched classification call, to
+# stay well inside the model's context window
+MAX_BATCH_CHARACTERS = 400000
+
+# Number of documents whose Bedrock results are kept in memory
+ANALYSIS_CACHE_MAX_ENTRIES = 64
+
+# Documents with more pages than this are extracted across a process pool
+PARALLEL_EXTRACTION_MIN_PAGES = 8
+
+# Fire every analysis prompt alongside classification and keep the matching one.
+# Roughly halves wall time but sends the document to Bedrock seven times per
+# analysis; set to "1" to enable.
+SPECULATIVE_ANALYSIS = os.environ.get("SPECULATIVE_ANALYSIS", "0") == "1"
+
+# Request latency-optimized inference; only some regions support it for this
+# model, so it is opt-in. Set to "1" when the client region supports it.
+LATENCY_OPTIMIZED = os.environ.get("BEDROCK_LATENCY_OPTIMIZED", "0") == "1"
+
+# Shared decoder for pulling the JSON object out of model responses
+JSON_DECODER = json.JSONDecoder()
+
 # Initialize session state variables if they don't exist
 if 'results' not in st.session_state:
     st.session_state.results = None
 if 'processing' not in st.session_state:
     st.session_state.processing = False
 
-def is_scanned_pdf(pdf_file):
+def extract_text_and_check(file_bytes):
     """
-    Check if a PDF is a scanned document or contains extractable text
+    Extract text from a PDF in a single pass and check if it is a scanned document
     
     Args:
-        pdf_file: BytesIO object containing PDF
+        file_bytes (bytes): Raw PDF bytes
         
     Returns:
-        bool: True if scanned, False if contains extractable text
+        tuple: (extracted_text, is_scanned) - text is empty if scanned
+        
+    Raises:
+        Exception: If the PDF cannot be read
     """
+    # Open once and share across the scan check and full extraction
+    pdf, num_pages = pdf_extraction.open_document(file_bytes)
+    fallback_pdf = pdf_extraction.FallbackPdf(file_bytes)
     try:
-        pdf_file.seek(0)  # Reset file pointer to beginning
-        with pdfplumber.open(pdf_file) as pdf:
-            if len(pdf.pages) == 0:
-                return True  # No pages means we can't extract text
-                
-            # Check the first 3 pages or all pages if less than 3
-            pages_to_check = min(3, len(pdf.pages))
-            text_content = ""
-            
-            for i in range(pages_to_check):
-                page = pdf.pages[i]
-                text = page.extract_text()
-                if text:
-                    text_content += text
-            
-            # If we found at least some text, it's not a scanned PDF
-            if len(text_content.strip()) > 100:  # Arbitrary threshold
-                return False
-            else:
-                return True
-                
-    except Exception as e:
-        # If we can't analyze it, assume it's scanned
-        st.error(f"Error checking PDF: {str(e)}")
-        return True
+        if num_pages == 0:
+            return "", True  # No pages means we can't extract text
+        
+        # Check the first 3 pages or all pages if less than 3, stopping as
+        # soon as enough text is found so the rest can go to the bulk path
+        pages_to_check = min(3, num_pages)
+        page_texts = []
+        text_length = 0
+        
+        for i in range(pages_to_check):
+            text = pdf_extraction.extract_pages(pdf, fallback_pdf, i, i + 1)[0]
+            page_texts.append(text)
+            text_length += len(text.strip())
+            if text_length > 100:  # Arbitrary threshold
+                break
+        else:
+            # If we found no real text in the first pages, it's a scanned PDF
+            return "", True
+        
+        # Parse the remaining pages across processes for large documents
+        checked_pages = len(page_texts)
+        if num_pages > PARALLEL_EXTRACTION_MIN_PAGES:
+            page_texts.extend(extract_pages_parallel(file_bytes, checked_pages, num_pages))
+        else:
+            page_texts.extend(pdf_extraction.extract_pages(pdf, fallback_pdf, checked_pages, num_pages))
+        
+        return "\n".join(page_texts), False
+    finally:
+        fallback_pdf.close()
+        pdf_extraction.close_document(pdf)
+
+@st.cache_resource
+def get_process_pool():
+    """
+    Create the process pool used for parallel page extraction
+    
+    Returns:
+        ProcessPoolExecutor: Shared executor with one worker per CPU
+    """
+    # Forking the multi-threaded Streamlit server can deadlock the children
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("forkserver"))
+
+def extract_pages_parallel(file_bytes, start, end):
+    """
+    Extract text from a range of pages across the process pool
+    
+    Args:
+        file_bytes (bytes): Raw PDF bytes
+        start (int): Index of the first page to extract
+        end (int): Index one past the last page to extract
+        
+    Returns:
+        list: Text of each page in the range, in page order
+        
+    Raises:
+        RuntimeError: If a worker process died while extracting
+    """
+    num_chunks = min(os.cpu_count() or 1, end - start)
+    chunks = pdf_extraction.split_page_range(start, end, num_chunks)
+    pool = get_process_pool()
+    
+    page_texts = []
+    try:
+        futures = [
+            pool.submit(pdf_extraction.extract_page_range, file_bytes, chunk_start, chunk_end)
+            for chunk_start, chunk_end in chunks
+        ]
+        for future in futures:
+            page_texts.extend(future.result())
+    except BrokenProcessPool:
+        # A worker died, e.g. the native parser crashed on a malformed file.
+        # Retire this pool so later calls get a fresh one, and don't retry the
+        # same bytes in-process where a crash would take down the server
+        pool.shutdown(wait=False, cancel_futures=True)
+        if get_process_pool() is pool:
+            get_process_pool.clear()
+        raise RuntimeError("Could not extract pages: a worker process died")
+    return page_texts
 
 def insert_document(doc_data):
     """
@@ -104,125 +207,604 @@ def insert_document(doc_data):
     # or implement actual database integration
     return "doc_" + datetime.now().strftime("%Y%m%d%H%M%S")
 
-def bedrock_calling(system_prompt, prompt_type, pdf_text):
+@st.cache_resource
+def get_event_loop():
     """
-    Call AWS Bedrock API with appropriate prompts
+    Start the event loop that runs all Bedrock calls, on a background thread
+    
+    Returns:
+        asyncio.AbstractEventLoop: Shared running loop
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+async def open_bedrock_client(session, config):
+    """
+    Open an async Bedrock runtime client for the app's lifetime
+    
+    The client is cached by get_bedrock_client and is never closed; its
+    connections are released when the server process exits.
     
     Args:
+        session (aioboto3.Session): Session holding the AWS credentials
+        config (AioConfig): Client configuration
+        
+    Returns:
+        aiobotocore client for the bedrock-runtime service
+    """
+    return await session.client('bedrock-runtime', config=config).__aenter__()
+
+@st.cache_resource
+def get_bedrock_client():
+    """
+    Create the Bedrock runtime client once and reuse it across reruns
+    
+    Returns:
+        aiobotocore client for the bedrock-runtime service, bound to get_event_loop()
+    """
+    # AWS Configuration - get from Streamlit secrets or environment
+    aws_access_key = os.environ.get("AWS_ACCESS_KEY_ID") or st.secrets.get("aws_access_key_id", "")
+    aws_secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY") or st.secrets.get("aws_secret_access_key", "")
+    
+    session = aioboto3.Session(
+        aws_access_key_id=aws_access_key,
+        aws_secret_access_key=aws_secret_key,
+        region_name='us-east-1'
+    )
+    
+    config = AioConfig(
+        max_pool_connections=32,
+        retries={'max_attempts': 3, 'mode': 'adaptive'}
+    )
+    return asyncio.run_coroutine_threadsafe(open_bedrock_client(session, config), get_event_loop()).result()
+
+async def bedrock_calling(bedrock, system_prompt, prompt_type, pdf_text, progress=None, max_tokens=4000, stop_sequences=None, cache_document=True):
+    """
+    Call AWS Bedrock API with appropriate prompts, streaming the response
+    
+    Args:
+        bedrock: Client from get_bedrock_client
         system_prompt (str): System prompt to use
         prompt_type (str): Type of prompt to use
         pdf_text (str): Extracted text from PDF
+        progress (dict): Optional dict whose "characters" count is updated as text streams in
+        max_tokens (int): Generation budget for the response
+        stop_sequences (list): Optional sequences that end generation early
+        cache_document (bool): Mark the document text for prompt caching; only
+            worth the cache-write premium when a later call reuses the same text
         
     Returns:
         dict: Structured analysis response
     """
     try:
-        # AWS Configuration - get from Streamlit secrets or environment
-        aws_access_key = os.environ.get("AWS_ACCESS_KEY_ID") or st.secrets.get("aws_access_key_id", "")
-        aws_secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY") or st.secrets.get("aws_secret_access_key", "")
-        
-        session = boto3.Session(
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name='us-east-1'
-        )
+        # Document text comes first so calls for the same document share a cached prefix
+        document_block = {"type": "text", "text": f"DOCUMENT TEXT:\n{pdf_text}"}
+        if cache_document:
+            document_block["cache_control"] = {"type": "ephemeral"}
         
         payload = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4000,
+            "max_tokens": max_tokens,
             "messages": [
                 {
                     "role": "user",
-                    "content": f"{system_prompt} \n\n {prompt_type}"
+                    "content": [
+                        document_block,
+                        {
+                            "type": "text",
+                            "text": f"{system_prompt} \n\n {prompt_type}"
+                        }
+                    ]
                 }
             ],
             "temperature": 0.3,
             "top_p": 0.9,
             "top_k": 250
         }
+        if stop_sequences:
+            payload["stop_sequences"] = stop_sequences
 
-        bedrock = session.client('bedrock-runtime')
         body = json.dumps(payload)
         model_id = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
         
-        response = bedrock.invoke_model(
+        invoke_kwargs = {}
+        if LATENCY_OPTIMIZED:
+            invoke_kwargs["performanceConfigLatency"] = "optimized"
+        
+        response = await bedrock.invoke_model_with_response_stream(
             body=body,
             modelId=model_id,
             accept="application/json",
             contentType="application/json",
+            **invoke_kwargs
         )
 
-        response_body = json.loads(response.get("body").read())
-        response_text = response_body.get("content")[0].get("text")
+        # Accumulate text deltas as they arrive
+        text_parts = []
+        async for event in response.get("body"):
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+            chunk_body = orjson.loads(chunk.get("bytes"))
+            if chunk_body.get("type") == "content_block_delta":
+                text = chunk_body.get("delta", {}).get("text", "")
+                text_parts.append(text)
+                if progress is not None:
+                    progress["characters"] += len(text)
+        response_text = "".join(text_parts)
         
-        # Extract JSON from response
+        # Extract JSON from response, decoding in place from the first brace
         start = response_text.find('{')
-        end = response_text.rfind('}') + 1
-        response_text = response_text[start:end]
-        return json.loads(response_text)
+        if start == -1:
+            raise ValueError("No JSON object found in model response")
+        result, _ = JSON_DECODER.raw_decode(response_text, start)
+        return result
     
     except Exception as e:
-        st.error(f"Error calling Bedrock API: {str(e)}")
+        # Reported by wait_with_progress, since this runs off the script thread
         return {"error": str(e)}
 
-def get_document_class(pdf_text):
+def submit_bedrock_call(system_prompt, prompt_type, pdf_text, max_tokens=4000, stop_sequences=None, cache_document=True):
+    """
+    Schedule bedrock_calling on the shared event loop
+    
+    Args:
+        system_prompt (str): System prompt to use
+        prompt_type (str): Type of prompt to use
+        pdf_text (str): Extracted text from PDF
+        max_tokens (int): Generation budget for the response
+        stop_sequences (list): Optional sequences that end generation early
+        cache_document (bool): Mark the document text for prompt caching
+        
+    Returns:
+        Future: Resolves to the structured analysis response, with a progress dict attached
+    """
+    progress = {"characters": 0}
+    coroutine = bedrock_calling(
+        get_bedrock_client(),
+        system_prompt=system_prompt,
+        prompt_type=prompt_type,
+        pdf_text=pdf_text,
+        progress=progress,
+        max_tokens=max_tokens,
+        stop_sequences=stop_sequences,
+        cache_document=cache_document
+    )
+    
+    # Cancelling the returned future also cancels the in-flight request
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+    future.progress = progress
+    return future
+
+def wait_with_progress(future, status, label):
+    """
+    Wait for a Bedrock call, updating the status label as the response streams in
+    
+    Args:
+        future (Future): Pending call from submit_bedrock_call
+        status: Streamlit status container to update
+        label (str): Base label for the status
+        
+    Returns:
+        dict: Structured analysis response
+    """
+    try:
+        while not future.done():
+            wait([future], timeout=0.25)
+            characters = future.progress["characters"]
+            if characters:
+                status.update(label=f"{label} ({characters} characters received)")
+    finally:
+        # A rerun or stop raises in the script thread; don't leave the call streaming
+        future.cancel()
+    
+    result = future.result()
+    if "error" in result:
+        st.error(f"Error calling Bedrock API: {result['error']}")
+    return result
+
+def submit_document_class(pdf_text, cache_document=True):
     """
-    Classify document type using classification prompt
+    Start classifying the document type in the background
     
     Args:
         pdf_text (str): Extracted text from PDF
+        cache_document (bool): Mark the document text for prompt caching
+        
+    Returns:
+        Future: Resolves to the document classification details
+    """
+    classification_prompt = prompts.user_prompt_classification(DOCUMENT_REFERENCE)
+    system_prompt = prompts.system_prompt_for_doc_classification
+    return submit_bedrock_call(
+        system_prompt,
+        classification_prompt,
+        pdf_text,
+        max_tokens=CLASSIFICATION_MAX_TOKENS,
+        stop_sequences=CLASSIFICATION_STOP_SEQUENCES,
+        cache_document=cache_document
+    )
+
+def submit_document_analysis(doc_class, pdf_text, cache_document=True):
+    """
+    Start the analysis for a document class in the background
+    
+    Args:
+        doc_class (int): Document class number
+        pdf_text (str): Extracted text from PDF
+        cache_document (bool): Mark the document text for prompt caching
+        
+    Returns:
+        Future: Resolves to the document analysis, or None for an invalid class
+    """
+    prompts_for_class = get_analysis_prompts(doc_class)
+    if prompts_for_class is None:
+        return None
+    system_prompt, user_prompt = prompts_for_class
+    return submit_bedrock_call(system_prompt, user_prompt, pdf_text, cache_document=cache_document)
+
+def get_document_class(classification_future):
+    """
+    Wait for the document classification
+    
+    Args:
+        classification_future (Future): Pending classification call
         
     Returns:
         dict: Document classification details
     """
     with st.status("Classifying document type...", expanded=True) as status:
-        classification_prompt = prompts.user_prompt_classification(pdf_text)
-        system_prompt = prompts.system_prompt_for_doc_classification
-        result = bedrock_calling(system_prompt=system_prompt, prompt_type=classification_prompt, pdf_text=pdf_text)
+        result = wait_with_progress(classification_future, status, "Classifying document type...")
         status.update(label="Document classification complete!", state="complete", expanded=False)
         return result
 
-def get_document_analysis(doc_class, pdf_text):
+def get_analysis_prompts(doc_class):
+    """
+    Build the system and user prompts for a document class
+    
+    Args:
+        doc_class (int): Document class number
+        
+    Returns:
+        tuple: (system_prompt, user_prompt), or None for an invalid class
+    """
+    # The mappings live in prompts, which is imported once rather than on every rerun
+    if not isinstance(doc_class, int) or not 0 <= doc_class < len(prompts.user_prompt_mapping):
+        return None
+
+    return prompts.system_prompt_mapping[doc_class], prompts.user_prompt_mapping[doc_class](DOCUMENT_REFERENCE, today)
+
+def get_document_analysis(doc_class, pdf_text, speculative_futures=None):
     """
     Generate appropriate document analysis based on classification
     
     Args:
         doc_class (int): Document class number
         pdf_text (str): Extracted text from PDF
+        speculative_futures (dict): Analysis calls already started, keyed by class
         
     Returns:
         dict: Document analysis
     """
     with st.status("Generating document analysis...", expanded=True) as status:
-        prompt_mapping = {
-            0: prompts.user_prompt_poi,
-            1: prompts.user_prompt_poa,
-            2: prompts.user_prompt_registration,
-            3: prompts.user_prompt_ownership,
-            4: prompts.user_prompt_tax_return,
-            5: prompts.user_prompt_financial
-        }
-
-        system_prompt_mapping = {
-            0: prompts.system_prompt_for_indentity_doc,
-            1: prompts.system_prompt_for_poa_doc,
-            2: prompts.system_prompt_for_registration_doc,
-            3: prompts.system_prompt_for_ownership_doc,
-            4: prompts.system_prompt_for_tax_return_doc,
-            5: prompts.system_prompt_for_financial_doc
-        }
-
-        if doc_class not in prompt_mapping:
+        speculative_futures = speculative_futures or {}
+        
+        # Discard the speculative calls for the other classes
+        for other_class, future in speculative_futures.items():
+            if other_class != doc_class:
+                future.cancel()
+        
+        future = speculative_futures.get(doc_class) or submit_document_analysis(doc_class, pdf_text)
+        if future is None:
             st.error(f"Invalid document class: {doc_class}")
             return {"error": f"Invalid document class: {doc_class}"}
-
-        user_prompt = prompt_mapping[doc_class](pdf_text, today)
-        system_prompt = system_prompt_mapping[doc_class]
         
-        result = bedrock_calling(system_prompt=system_prompt, prompt_type=user_prompt, pdf_text=pdf_text)
+        result = wait_with_progress(future, status, "Generating document analysis...")
         status.update(label="Document analysis complete!", state="complete", expanded=False)
         return result
 
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_cached_text(file_hash, _file_bytes):
+    """
+    Extract text and run the scan check, memoized by file content hash
+    
+    Read errors raise instead of returning, so they are never cached.
+    
+    Args:
+        file_hash (str): Hash of the PDF bytes, used as the cache key
+        _file_bytes (bytes): Raw PDF bytes (not hashed by Streamlit)
+        
+    Returns:
+        tuple: (extracted_text, is_scanned)
+    """
+    return extract_text_and_check(_file_bytes)
+
+@st.cache_resource
+def get_analysis_cache():
+    """
+    Create the store for Bedrock results, shared across sessions
+    
+    A plain dict rather than st.cache_data, so the status widgets that track
+    the calls are always drawn by the caller instead of replayed from a cache.
+    
+    Returns:
+        tuple: (OrderedDict of results, Lock guarding it)
+    """
+    return OrderedDict(), threading.Lock()
+
+def get_cached_result(key):
+    """
+    Look up Bedrock results in the shared cache
+    
+    Args:
+        key (tuple): (file_hash, date)
+        
+    Returns:
+        The cached results, or None if there are none
+    """
+    results, lock = get_analysis_cache()
+    with lock:
+        if key not in results:
+            return None
+        results.move_to_end(key)
+        return results[key]
+
+def set_cached_result(key, value):
+    """
+    Store Bedrock results, evicting the least recently used past ANALYSIS_CACHE_MAX_ENTRIES
+    
+    Args:
+        key (tuple): (file_hash, date)
+        value: Results to store
+    """
+    results, lock = get_analysis_cache()
+    with lock:
+        results[key] = value
+        results.move_to_end(key)
+        while len(results) > ANALYSIS_CACHE_MAX_ENTRIES:
+            results.popitem(last=False)
+
+def analyze_document_text(file_hash, extracted_text):
+    """
+    Classify and analyze the document text, reusing results for the same file and date
+    
+    Failed calls raise instead of returning, so errors are never cached.
+    
+    Args:
+        file_hash (str): Hash of the PDF bytes
+        extracted_text (str): Extracted text from PDF
+        
+    Returns:
+        tuple: (classification_result, analysis_result)
+    """
+    # The analysis prompts check validity against today's date, so it is part of the key
+    cache_key = (file_hash, today)
+    cached = get_cached_result(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Start classification, and speculatively every analysis, concurrently.
+    # Speculative calls all start at once, so none could read a cached prefix
+    classification_future = submit_document_class(extracted_text, cache_document=not SPECULATIVE_ANALYSIS)
+    speculative_futures = {}
+    try:
+        if SPECULATIVE_ANALYSIS:
+            for doc_class in range(len(prompts.user_prompt_mapping)):
+                speculative_futures[doc_class] = submit_document_analysis(doc_class, extracted_text, cache_document=False)
+        
+        # Classify document
+        classification_result = get_document_class(classification_future)
+        if "error" in classification_result:
+            raise RuntimeError(classification_result["error"])
+        doc_class = classification_result.get('class')
+        
+        # Analyze document
+        analysis_result = get_document_analysis(doc_class, extracted_text, speculative_futures)
+        if "error" in analysis_result:
+            raise RuntimeError(analysis_result["error"])
+    finally:
+        # Covers errors and reruns/stops raised while waiting
+        for future in speculative_futures.values():
+            future.cancel()
+    
+    set_cached_result(cache_key, (classification_result, analysis_result))
+    return classification_result, analysis_result
+
+def chunk_documents(documents):
+    """
+    Group documents into batches that fit in a single classification call
+    
+    Args:
+        documents (list): (doc_id, text) tuples
+        
+    Returns:
+        list: Lists of (doc_id, text) tuples, each under MAX_BATCH_CHARACTERS
+    """
+    batches, current, current_size = [], [], 0
+    for doc_id, text in documents:
+        if current and current_size + len(text) > MAX_BATCH_CHARACTERS:
+            batches.append(current)
+            current, current_size = [], 0
+        current.append((doc_id, text))
+        current_size += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+def submit_batch_class(documents):
+    """
+    Start classifying a batch of documents in a single call
+    
+    Args:
+        documents (list): (doc_id, text) tuples
+        
+    Returns:
+        Future: Resolves to {"documents": [classification details with "id"]}
+    """
+    batch_text = "\n\n".join(f'<doc id="{doc_id}">\n{text}\n</doc>' for doc_id, text in documents)
+    classification_prompt = prompts.user_prompt_batch_classification(DOCUMENT_REFERENCE)
+    system_prompt = prompts.system_prompt_for_doc_classification
+    return submit_bedrock_call(
+        system_prompt,
+        classification_prompt,
+        batch_text,
+        max_tokens=min(CLASSIFICATION_MAX_TOKENS * len(documents), 8192),  # Model output limit
+        stop_sequences=CLASSIFICATION_STOP_SEQUENCES,
+        cache_document=False  # The combined batch text is never sent again
+    )
+
+def get_batch_classes(texts):
+    """
+    Classify several documents with as few calls as possible
+    
+    Args:
+        texts (list): Extracted text of each document
+        
+    Returns:
+        list: Document classification details, in the same order as texts; a
+            document whose batch failed has an "error" key
+    """
+    documents = list(enumerate(texts, start=1))
+    batches = chunk_documents(documents)
+    with st.status("Classifying documents...", expanded=True) as status:
+        futures = [submit_batch_class(batch) for batch in batches]
+        
+        classifications = {}
+        try:
+            for batch, future in zip(batches, futures):
+                result = wait_with_progress(future, status, "Classifying documents...")
+                if "error" in result:
+                    # Only the documents in the failed batch lose their classification
+                    for doc_id, _ in batch:
+                        classifications[str(doc_id)] = {"error": result["error"]}
+                    continue
+                for item in result.get("documents", []):
+                    classifications[str(item.get("id"))] = item
+        finally:
+            for future in futures:
+                future.cancel()
+        
+        status.update(label="Document classification complete!", state="complete", expanded=False)
+    
+    return [
+        classifications.get(str(doc_id), {"error": f"No classification returned for document {doc_id}"})
+        for doc_id, _ in documents
+    ]
+
+def analyze_documents_text(file_hashes, texts):
+    """
+    Classify documents in batches and analyze each, reusing results for the same file and date
+    
+    Only documents without cached results are sent to Bedrock, and only
+    successful results are cached, so a partial failure does not lose or
+    repeat the work done for the other documents.
+    
+    Args:
+        file_hashes (list): Hash of each PDF
+        texts (list): Extracted text of each document
+        
+    Returns:
+        list: (classification_result, analysis_result) for each document; a
+            failed document has an "error" key in its analysis_result
+    """
+    documents = [get_cached_result((file_hash, today)) for file_hash in file_hashes]
+    missing = [i for i, document in enumerate(documents) if document is None]
+    if not missing:
+        return documents
+    
+    classification_results = get_batch_classes([texts[i] for i in missing])
+    
+    # Fan out every analysis before waiting on any of them. Each document's
+    # text was only sent inside the combined batch, so there is no cached
+    # prefix to reuse
+    analysis_futures = []
+    for i, classification_result in zip(missing, classification_results):
+        future = None
+        if "error" not in classification_result:
+            future = submit_document_analysis(classification_result.get('class'), texts[i], cache_document=False)
+        analysis_futures.append(future)
+    
+    try:
+        for i, classification_result, future in zip(missing, classification_results, analysis_futures):
+            if "error" in classification_result:
+                documents[i] = (classification_result, {"error": classification_result["error"]})
+                continue
+            doc_class = classification_result.get('class')
+            futures = {doc_class: future} if future is not None else {}
+            analysis_result = get_document_analysis(doc_class, texts[i], futures)
+            documents[i] = (classification_result, analysis_result)
+            if "error" not in analysis_result:
+                set_cached_result((file_hashes[i], today), documents[i])
+    finally:
+        for future in analysis_futures:
+            if future is not None:
+                future.cancel()
+    
+    return documents
+
+def read_document(uploaded_file, index=0):
+    """
+    Extract text from an uploaded PDF and show a preview
+    
+    Args:
+        uploaded_file: UploadedFile object from Streamlit
+        index (int): Position of the file in the upload, used for widget keys
+        
+    Returns:
+        tuple: (file_hash, extracted_text), or None if the document is scanned or unreadable
+    """
+    # Read file bytes
+    file_bytes = uploaded_file.getvalue()
+    file_hash = xxhash.xxh3_128_hexdigest(file_bytes)
+    
+    # Extract text and check if scanned
+    try:
+        extracted_text, is_scanned = get_cached_text(file_hash, file_bytes)
+    except Exception as e:
+        st.error(f"Error checking PDF {uploaded_file.name}: {str(e)}")
+        return None
+    if is_scanned:
+        st.error(f"{uploaded_file.name} appears to be a scanned document. The current version does not support scanned PDFs.")
+        return None
+    
+    # Show text preview
+    with st.expander(f"Preview extracted text - {uploaded_file.name}", expanded=False):
+        st.text_area("Extracted Text", extracted_text, height=200, key=f"extracted_text_{index}")
+    
+    return file_hash, extracted_text
+
+def build_results(uploaded_file, classification_result, analysis_result):
+    """
+    Assemble the final response for a document
+    
+    Args:
+        uploaded_file: UploadedFile object from Streamlit
+        classification_result (dict): Document classification details
+        analysis_result (dict): Document analysis
+        
+    Returns:
+        dict: Analysis results
+    """
+    # Prepare final response
+    final_response = {
+        "document_type": classification_result.get('category'),
+        "analysis": analysis_result
+    }
+    
+    # Add mock DB ID
+    mongo_obj_id = insert_document(final_response)
+    final_response["mongo_obj_id"] = mongo_obj_id
+    
+    # Serialize the download payload once rather than on every rerun
+    try:
+        download_data = orjson.dumps(final_response, option=orjson.OPT_INDENT_2)
+    except TypeError:
+        # orjson rejects integers beyond 64 bits (e.g. long account numbers)
+        download_data = json.dumps(final_response, indent=2).encode()
+    
+    return {"filename": uploaded_file.name, "result": final_response, "download_data": download_data}
+
 def process_document(uploaded_file):
     """
     Process the uploaded PDF document
@@ -236,58 +818,77 @@ def process_document(uploaded_file):
     try:
         st.session_state.processing = True
         
-        # Read file bytes
-        file_bytes = uploaded_file.getvalue()
-        
-        # Create BytesIO object
-        pdf_file = io.BytesIO(file_bytes)
-        
-        # Check if scanned
-        if is_scanned_pdf(pdf_file):
-            st.error("This appears to be a scanned document. The current version does not support scanned PDFs.")
+        document = read_document(uploaded_file)
+        if document is None:
             st.session_state.processing = False
             return None
+        file_hash, extracted_text = document
         
-        # Extract text
-        pdf_file.seek(0)  # Reset file pointer
-        with pdfplumber.open(pdf_file) as pdf:
-            extracted_text = "\n".join([page.extract_text() or "" for page in pdf.pages])
+        # Classify and analyze document
+        classification_result, analysis_result = analyze_document_text(file_hash, extracted_text)
         
-        # Show text preview
-        with st.expander("Preview extracted text", expanded=False):
-            st.text_area("Extracted Text", extracted_text, height=200)
+        st.session_state.processing = False
+        return build_results(uploaded_file, classification_result, analysis_result)
+    
+    except Exception as e:
+        st.error(f"Error processing document: {str(e)}")
+        st.session_state.processing = False
+        return None
+
+def process_documents(uploaded_files):
+    """
+    Process several uploaded PDF documents with batched classification
+    
+    Args:
+        uploaded_files (list): UploadedFile objects from Streamlit
         
-        # Classify document
-        classification_result = get_document_class(extracted_text)
-        doc_class = classification_result.get('class')
+    Returns:
+        list: Analysis results for each document that could be processed
+    """
+    if len(uploaded_files) == 1:
+        results = process_document(uploaded_files[0])
+        return [results] if results else None
+    
+    try:
+        st.session_state.processing = True
         
-        # Analyze document
-        analysis_result = get_document_analysis(doc_class, extracted_text)
+        readable_files, file_hashes, texts = [], [], []
+        for index, uploaded_file in enumerate(uploaded_files):
+            document = read_document(uploaded_file, index)
+            if document is not None:
+                readable_files.append(uploaded_file)
+                file_hashes.append(document[0])
+                texts.append(document[1])
         
-        # Prepare final response
-        final_response = {
-            "document_type": classification_result.get('category'),
-            "analysis": analysis_result
-        }
+        if not readable_files:
+            st.session_state.processing = False
+            return None
         
-        # Add mock DB ID
-        mongo_obj_id = insert_document(final_response)
-        final_response["mongo_obj_id"] = mongo_obj_id
+        # Classify all documents together, then analyze them concurrently
+        documents = analyze_documents_text(file_hashes, texts)
+        
+        results = []
+        for uploaded_file, (classification_result, analysis_result) in zip(readable_files, documents):
+            if "error" in analysis_result:
+                st.error(f"Error processing {uploaded_file.name}: {analysis_result['error']}")
+                continue
+            results.append(build_results(uploaded_file, classification_result, analysis_result))
         
         st.session_state.processing = False
-        return {"result": final_response}
+        return results or None
     
     except Exception as e:
-        st.error(f"Error processing document: {str(e)}")
+        st.error(f"Error processing documents: {str(e)}")
         st.session_state.processing = False
         return None
 
-def display_results(results):
+def display_results(results, index=0):
     """
     Display the analysis results in a structured format
     
     Args:
         results: Analysis results dictionary
+        index (int): Position of the document in the results, used for widget keys
     """
     if not results or "result" not in results:
         return
@@ -296,7 +897,8 @@ def display_results(results):
     
     st.markdown('<div class="sub-header">📄 Document Analysis Results</div>', unsafe_allow_html=True)
     
-    # Document type
+    # Document name and type
+    st.markdown(f"**File:** {results['filename']}")
     st.markdown(f"**Document Type:** {result['document_type']}")
     
     # Analysis
@@ -328,10 +930,11 @@ def display_results(results):
             fields = analysis["extracted_fields"]
             
             if isinstance(fields, dict):
-                # Convert to DataFrame for better display
-                import pandas as pd
-                df = pd.DataFrame(list(fields.items()), columns=["Field", "Value"])
-                st.dataframe(df, use_container_width=True)
+                # Pass plain columns; st.dataframe does its own conversion
+                st.dataframe(
+                    {"Field": list(fields.keys()), "Value": list(fields.values())},
+                    use_container_width=True
+                )
             elif isinstance(fields, list):
                 for item in fields:
                     if isinstance(item, dict):
@@ -360,9 +963,10 @@ def display_results(results):
     # Download results
     st.download_button(
         label="Download Analysis (JSON)",
-        data=json.dumps(result, indent=2),
+        data=results["download_data"],
         file_name=f"document_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-        mime="application/json"
+        mime="application/json",
+        key=f"download_{index}"
     )
 
 # Main app
@@ -371,7 +975,7 @@ def main():
     
     st.markdown("""
     <div class="info-box">
-    Upload a PDF document to generate an automated summary and analysis. This tool identifies document type and extracts key information.
+    Upload one or more PDF documents to generate an automated summary and analysis. This tool identifies document type and extracts key information.
     </div>
     """, unsafe_allow_html=True)
     
@@ -394,24 +998,26 @@ def main():
         """)
     
     # File upload
-    uploaded_file = st.file_uploader("Upload a PDF document", type=["pdf"])
+    uploaded_files = st.file_uploader("Upload PDF documents", type=["pdf"], accept_multiple_files=True)
     
-    if uploaded_file is not None:
+    if uploaded_files:
         # Display file info
-        file_details = {
-            "Filename": uploaded_file.name,
-            "File size": f"{uploaded_file.size / 1024:.2f} KB"
-        }
-        st.write("File Details:", file_details)
+        for uploaded_file in uploaded_files:
+            file_details = {
+                "Filename": uploaded_file.name,
+                "File size": f"{uploaded_file.size / 1024:.2f} KB"
+            }
+            st.write("File Details:", file_details)
         
         # Process button
         if st.button("Analyze Document"):
             with st.spinner("Processing document..."):
-                st.session_state.results = process_document(uploaded_file)
+                st.session_state.results = process_documents(uploaded_files)
     
     # Display results if available
     if st.session_state.results:
-        display_results(st.session_state.results)
+        for index, results in enumerate(st.session_state.results):
+            display_results(results, index)
     
     # Display processing message
     if st.session_state.processing: